@@ -1,3 +1,4 @@
+import base64
 import json
 import logging
 from collections import defaultdict
@@ -7,7 +8,9 @@ from datetime import timedelta
 from pathlib import Path
 from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
 from urllib.parse import urljoin
+from uuid import UUID
 
+from dateutil import parser
 from dateutil.tz import tz
 
 import flask
@@ -93,6 +96,7 @@ def stac_search():
         product_name = request.args.get("product")
         limit = request.args.get("limit", default=DEFAULT_PAGE_SIZE, type=int)
         offset = request.args.get("_o", default=0, type=int)
+        cursor = request.args.get("cursor")
     else:
         req_data = request.get_json()
         bbox = req_data.get("bbox")
@@ -100,6 +104,7 @@ def stac_search():
         product_name = req_data.get("product")
         limit = req_data.get("limit") or DEFAULT_PAGE_SIZE
         offset = req_data.get("_o") or 0
+        cursor = req_data.get("cursor")
 
     if limit > PAGE_SIZE_LIMIT:
         abort(
@@ -114,14 +119,14 @@ def stac_search():
     if time is not None:
         time = _parse_time_range(time)
 
-    def next_page_url(next_offset):
+    def next_page_url(next_cursor):
         return url_for(
             ".stac_search",
             product=product_name,
             bbox="[{},{},{},{}]".format(*bbox) if bbox else None,
             time=_unparse_time_range(time) if time else None,
             limit=limit,
-            _o=next_offset,
+            cursor=next_cursor,
         )
 
     return _utils.as_geojson(
@@ -131,15 +136,17 @@ def stac_search():
             time=time,
             limit=limit,
             offset=offset,
+            after=_cursor_arg(cursor, offset),
             get_next_url=next_page_url,
         )
     )
 
 
 def search_stac_items(
-    get_next_url: Callable[[int], str],
+    get_next_url: Callable[[str], str],
     limit: int = DEFAULT_PAGE_SIZE,
     offset: int = 0,
+    after: Optional[Tuple[datetime, UUID]] = None,
     product_name: Optional[str] = None,
     bbox: Optional[Tuple[float, float, float, float]] = None,
     time: Optional[Tuple[datetime, datetime]] = None,
@@ -147,7 +154,8 @@ def search_stac_items(
     """
     Perform a search, returning a FeatureCollection of stac Item results.
 
-    :param get_next_url: A function that calculates a page url for the given offset.
+    :param get_next_url: A function that calculates a page url for the given cursor.
+    :param after: Continue after this (center_time, id): a decoded paging cursor.
     """
     offset = offset or 0
     items = list(
@@ -157,25 +165,77 @@ def search_stac_items(
             bbox=bbox,
             limit=limit + 1,
             offset=offset,
+            after=after,
             full_dataset=True,
         )
     )
+    page_items = items[:limit]
 
     result = dict(
         type="FeatureCollection",
-        features=[as_stac_item(f) for f in items[:limit]],
-        meta=dict(page=offset // limit, limit=limit),
+        features=[as_stac_item(f) for f in page_items],
+        # Page numbers are only known when paging by offset.
+        meta=dict(limit=limit) if after else dict(page=offset // limit, limit=limit),
         links=[],
     )
 
     there_are_more = len(items) == limit + 1
 
     if there_are_more:
-        result["links"].append(dict(rel="next", href=get_next_url(offset + limit)))
+        # Next pages continue after our last item, rather than using an offset,
+        # so they don't get slower as we page further.
+        last_item = page_items[-1]
+        next_cursor = _encode_cursor(last_item.center_time, last_item.dataset_id)
+        result["links"].append(dict(rel="next", href=get_next_url(next_cursor)))
 
     return result
 
 
+def _cursor_arg(
+    cursor: Optional[str], offset: int = 0
+) -> Optional[Tuple[datetime, UUID]]:
+    """
+    Decode a paging cursor given by the user, aborting if it's unusable.
+    """
+    if not cursor:
+        return None
+    # (Json POST bodies can contain any type)
+    if not isinstance(cursor, str):
+        abort(400, "Invalid paging cursor")
+    if offset:
+        abort(400, "A paging cursor cannot be combined with an offset (_o)")
+    try:
+        return _decode_cursor(cursor)
+    except ValueError:
+        abort(400, "Invalid paging cursor")
+
+
+def _encode_cursor(center_time: datetime, dataset_id: UUID) -> str:
+    """
+    An opaque paging cursor: the sort key of the last item on a page.
+
+    >>> _encode_cursor(
+    ...     datetime(2017, 4, 19, 1, 45, 56, tzinfo=tz.tzutc()),
+    ...     UUID('87676cf2-ef18-47b5-ba30-53a99539428d'),
+    ... )
+    'MjAxNy0wNC0xOVQwMTo0NTo1NiswMDowMF84NzY3NmNmMi1lZjE4LTQ3YjUtYmEzMC01M2E5OTUzOTQyOGQ='
+    """
+    key = f"{center_time.isoformat()}_{dataset_id}"
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """
+    >>> _decode_cursor(
+    ...     'MjAxNy0wNC0xOVQwMTo0NTo1NiswMDowMF84NzY3NmNmMi1lZjE4LTQ3YjUtYmEzMC01M2E5OTUzOTQyOGQ='
+    ... )
+    (datetime.datetime(2017, 4, 19, 1, 45, 56, tzinfo=tzutc()), UUID('87676cf2-ef18-47b5-ba30-53a99539428d'))
+    """
+    key = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    center_time, _, dataset_id = key.rpartition("_")
+    return parser.isoparse(center_time), UUID(dataset_id)
+
+
 @bp.route("/collections/<product_name>")
 def collection(product_name: str):
     """
@@ -223,18 +283,20 @@ def collection_items(product_name: str):
     (with paging)
     """
 
-    def next_url(offset):
-        return url_for(".collection_items", product_name=product_name, _o=offset)
+    def next_url(cursor):
+        return url_for(".collection_items", product_name=product_name, cursor=cursor)
 
     all_time_summary = _model.get_time_summary(product_name)
     if not all_time_summary:
         abort(404, "Product not yet summarised")
 
+    offset = request.args.get("_o", default=0, type=int)
     feature_collection = search_stac_items(
         product_name=product_name,
         limit=PAGE_SIZE_LIMIT,
         get_next_url=next_url,
-        offset=request.args.get("_o", default=0, type=int),
+        offset=offset,
+        after=_cursor_arg(request.args.get("cursor"), offset),
     )
 
     # Maybe we shouldn't include "found" as it prevents some future optimisation?
@@ -1,11 +1,26 @@
+import atexit
 import datetime
+import io
+import logging
+import logging.handlers
+import os
 import pathlib
+import queue
+import signal
 import sys
+import threading
+import time
+import traceback
 import uuid
 
 import rapidjson
 import structlog
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 def init_logging(output_file=None, verbose=False):
     """
@@ -13,52 +28,361 @@ def init_logging(output_file=None, verbose=False):
 
     This defaults to stdout as it's the parseable json output of the program.
     Libraries with "unstructured" logs (such as datacube core logging) go to stderr.
+
+    The output file can be a text or binary stream.
     """
 
     if output_file is None:
         output_file = sys.stdout
 
-    # Note that we can't use functools.partial: it JSONRendering will pass its
-    # own 'default' property that overrides our own.
-    def lenient_json_dump(obj, *args, **kwargs):
-        return rapidjson.dumps(
-            obj,
-            datetime_mode=rapidjson.DM_ISO8601,
-            uuid_mode=rapidjson.UM_CANONICAL,
-            number_mode=rapidjson.NM_NATIVE,
-            sort_keys=True,
-            default=lenient_json_fallback,
-        )
+    # Coloured output if to terminal, otherwise json
+    if output_file.isatty():
+        processors = _CONSOLE_PROCESSORS
+        logger_factory = structlog.PrintLoggerFactory(file=output_file)
+    else:
+        processors = _JSON_PROCESSORS
+        # The json renderer produces bytes, so write them straight to the
+        # underlying binary stream rather than re-encoding via text.
+        if hasattr(output_file, "buffer"):
+            output_file = output_file.buffer
+        elif isinstance(output_file, io.TextIOBase):
+            # A text-only stream, such as a StringIO.
+            output_file = _Utf8TextWriter(output_file)
+        event_log = _BatchedBytesLogger(output_file)
+        _use_event_log(event_log)
 
-    # Direct structlog into standard logging.
-    processors = [
-        structlog.stdlib.add_log_level,
-        structlog.processors.TimeStamper(fmt="ISO"),
-        structlog.processors.StackInfoRenderer(),
-        structlog.processors.format_exc_info,
-        # Coloured output if to terminal, otherwise json
-        structlog.dev.ConsoleRenderer()
-        if output_file.isatty()
-        else structlog.processors.JSONRenderer(serializer=lenient_json_dump),
-    ]
-
-    if not verbose:
-        processors.insert(0, _filter_informational)
+        def logger_factory(*args):
+            return event_log
+
+    _log_libraries_to_stderr()
 
     structlog.configure(
         processors=processors,
         context_class=dict,
+        # Filter by level before any event is built, rather than dropping it later.
+        wrapper_class=structlog.make_filtering_bound_logger(
+            logging.DEBUG if verbose else logging.WARNING
+        ),
         cache_logger_on_first_use=True,
-        logger_factory=structlog.PrintLoggerFactory(file=output_file),
+        logger_factory=logger_factory,
     )
 
 
-def _filter_informational(logger, log_method, event_dict):
-    if log_method in ("debug", "info"):
-        raise structlog.DropEvent
+def flush_logs(blocking=True):
+    """
+    Write out any log events that are still waiting in a batch.
+
+    If not blocking, give up if another write is in progress.
+    """
+    if _EVENT_LOG is not None:
+        _EVENT_LOG.flush(blocking=blocking)
+
+
+_LIBRARY_LOG_HANDLER = None
+_LIBRARY_LOG_LISTENER = None
+
+
+def _log_libraries_to_stderr():
+    """
+    Send standard logging (used by libraries such as datacube core) to stderr.
+
+    Records are passed through a queue, and a background thread does the
+    writing, so a slow stderr doesn't block the thread doing the logging.
+    (Records are still formatted in the logging thread.)
+
+    Our handler is added alongside any the host has already installed.
+    """
+    global _LIBRARY_LOG_HANDLER, _LIBRARY_LOG_LISTENER
+    if _LIBRARY_LOG_HANDLER is not None:
+        return
+
+    log_queue = queue.Queue()
+    _LIBRARY_LOG_HANDLER = logging.handlers.QueueHandler(log_queue)
+    logging.getLogger().addHandler(_LIBRARY_LOG_HANDLER)
+    _LIBRARY_LOG_LISTENER = logging.handlers.QueueListener(
+        log_queue, logging.StreamHandler(sys.stderr)
+    )
+    _LIBRARY_LOG_LISTENER.start()
+    atexit.register(_LIBRARY_LOG_LISTENER.stop)
+
+    # The listener thread doesn't exist in forked children, so they write directly.
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_log_libraries_directly_to_stderr)
+
+
+def _log_libraries_directly_to_stderr():
+    global _LIBRARY_LOG_HANDLER, _LIBRARY_LOG_LISTENER
+    root = logging.getLogger()
+    root.removeHandler(_LIBRARY_LOG_HANDLER)
+    _LIBRARY_LOG_HANDLER = logging.StreamHandler(sys.stderr)
+    root.addHandler(_LIBRARY_LOG_HANDLER)
+    _LIBRARY_LOG_LISTENER = None
+
+
+class _Utf8TextWriter:
+    """
+    Write (utf-8) bytes to a text stream that has no underlying binary buffer.
+    """
+
+    def __init__(self, file):
+        self._file = file
+
+    def write(self, data: bytes):
+        self._file.write(data.decode("utf-8"))
+
+    def flush(self):
+        self._file.flush()
+
+
+class _BatchedBytesLogger:
+    """
+    A structlog logger that writes (json) lines to a binary file in batches.
+
+    structlog's own BytesLogger writes and flushes every event separately. Here,
+    debug and info events are collected and written together: once enough have
+    built up, or at most `max_delay` seconds after the first.
+
+    Warnings and errors are always written immediately (along with anything
+    before them), so they're never held back.
+
+    (We only use this for non-interactive output: terminals are unbuffered.)
+    """
+
+    def __init__(self, file, buffer_size=64 * 1024, max_delay=1.0):
+        self._file = file
+        self._buffer_size = buffer_size
+        self._max_delay = max_delay
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_size = 0
+        self._timer = None
+
+    def _batch(self, message: bytes):
+        with self._lock:
+            self._pending.append(message + b"\n")
+            self._pending_size += len(message) + 1
+            if self._pending_size >= self._buffer_size:
+                self._write_pending()
+            elif self._timer is None:
+                self._timer = threading.Timer(self._max_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _write_now(self, message: bytes):
+        with self._lock:
+            self._pending.append(message + b"\n")
+            self._write_pending()
+
+    msg = log = debug = info = _batch
+    warn = warning = err = error = critical = exception = fatal = failure = _write_now
+
+    def flush(self, blocking=True):
+        if not self._lock.acquire(blocking):
+            return
+        try:
+            self._write_pending()
+        finally:
+            self._lock.release()
+
+    def disable_batching(self):
+        """
+        Write every event immediately from now on.
+
+        For use in a forked child, where our lock and timer thread may not have
+        survived the fork.
+        """
+        self._lock = threading.Lock()
+        self._timer = None
+        self._buffer_size = 0
+
+    def _write_pending(self):
+        # (Called with the lock held)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        data = b"".join(self._pending)
+        self._pending.clear()
+        self._pending_size = 0
+        self._file.write(data)
+        self._file.flush()
+
+
+# The current batched event log, if any. The exit, signal and fork hooks are only
+# installed once, and act on whichever log this is at the time.
+_EVENT_LOG = None
+_EVENT_LOG_HOOKS_INSTALLED = False
+
+
+def _use_event_log(event_log: _BatchedBytesLogger):
+    global _EVENT_LOG, _EVENT_LOG_HOOKS_INSTALLED
+    flush_logs()
+    _EVENT_LOG = event_log
+
+    if _EVENT_LOG_HOOKS_INSTALLED:
+        return
+    atexit.register(flush_logs)
+    _flush_on_sigterm()
+    # Forked workers (eg. multiprocessing pools) exit without running atexit
+    # handlers, so they write directly rather than batching.
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(before=flush_logs, after_in_child=_unbatch_event_log)
+    _EVENT_LOG_HOOKS_INSTALLED = True
+
+
+def _unbatch_event_log():
+    if _EVENT_LOG is not None:
+        _EVENT_LOG.disable_batching()
+
+
+def _flush_on_sigterm():
+    """
+    Make sure pending log lines are written if we're terminated.
+
+    A plain SIGTERM doesn't run atexit handlers, so we exit "normally" instead.
+    """
+    # Signal handlers can only be installed from the main thread.
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    previous_handler = signal.getsignal(signal.SIGTERM)
+
+    def _handle(signum, frame):
+        # Signal handlers run in the main thread, which may have been interrupted
+        # mid-write while holding the log's lock: waiting for it would hang forever.
+        # (Anything still pending is written by the atexit hook as we exit.)
+        flush_logs(blocking=False)
+        if callable(previous_handler):
+            previous_handler(signum, frame)
+        elif previous_handler != signal.SIG_IGN:
+            sys.exit(128 + signum)
+
+    signal.signal(signal.SIGTERM, _handle)
+
+
+# Note that we can't use functools.partial: JSONRenderer will pass its
+# own 'default' property that overrides our own.
+#
+# Keys are left in insertion order: sorting every event is wasted work for
+# machine-readers. (The ConsoleRenderer for humans still sorts them.)
+def _orjson_dumps(obj, *args, **kwargs):
+    # (Datetimes are rendered the same as rapidjson's, so output doesn't depend on
+    # which is installed.)
+    try:
+        return orjson.dumps(
+            obj, default=lenient_json_fallback, option=orjson.OPT_NON_STR_KEYS
+        )
+    except TypeError:
+        # orjson refuses some values outright, without calling our fallback (such
+        # as integers wider than 64 bits). Logging must never fail, so use rapidjson.
+        return _rapidjson_dumps(obj)
+
+
+class _LenientRapidJsonEncoder(rapidjson.Encoder):
+    def default(self, obj):
+        return lenient_json_fallback(obj)
+
+
+# A single reusable encoder, rather than setting up a new one for every event.
+_RAPIDJSON_ENCODER = _LenientRapidJsonEncoder(
+    datetime_mode=rapidjson.DM_ISO8601,
+    uuid_mode=rapidjson.UM_CANONICAL,
+    number_mode=rapidjson.NM_NATIVE,
+    ensure_ascii=False,
+)
+
+
+# Slower, but can also render integers too large for a native int, and NaN.
+_RAPIDJSON_NON_NATIVE_ENCODER = _LenientRapidJsonEncoder(
+    datetime_mode=rapidjson.DM_ISO8601,
+    uuid_mode=rapidjson.UM_CANONICAL,
+    ensure_ascii=False,
+)
+
+
+def _rapidjson_dumps(obj, *args, **kwargs):
+    try:
+        return _RAPIDJSON_ENCODER(obj).encode("utf-8")
+    except (OverflowError, ValueError):
+        return _RAPIDJSON_NON_NATIVE_ENCODER(obj).encode("utf-8")
+
+
+# orjson is considerably faster, but optional: fall back to rapidjson.
+lenient_json_dump = _orjson_dumps if orjson is not None else _rapidjson_dumps
+
+
+class _CachingTimeStamper:
+    """
+    Add a UTC ISO "timestamp" to each event, with one-second resolution.
+
+    Bursts of events share the same second, so it's only formatted once per second
+    (unlike structlog's TimeStamper, which formats the time for every event).
+    """
+
+    def __init__(self):
+        # (epoch second, formatted) kept as one tuple, so threads never see a mix.
+        self._last = (None, None)
+
+    def __call__(self, logger, log_method, event_dict):
+        second = int(time.time())
+        cached_second, formatted = self._last
+        if second != cached_second:
+            formatted = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(second))
+            self._last = (second, formatted)
+        event_dict["timestamp"] = formatted
+        return event_dict
+
+
+def _render_stack_and_exc_info(logger, log_method, event_dict):
+    """
+    Render stack/exception info, if any.
+
+    (Equivalent to structlog's StackInfoRenderer and format_exc_info processors,
+    but most events have neither, so one key check saves calling both.)
+    """
+    if event_dict.pop("stack_info", None):
+        # Skip structlog's frames and our own to find the caller.
+        frame = sys._getframe()
+        while frame.f_back and frame.f_globals.get("__name__", "").startswith(
+            ("structlog", __name__)
+        ):
+            frame = frame.f_back
+        event_dict["stack"] = "Stack (most recent call last):\n" + "".join(
+            traceback.format_stack(frame)
+        ).rstrip("\n")
+    if "exc_info" in event_dict:
+        event_dict = structlog.processors.format_exc_info(
+            logger, log_method, event_dict
+        )
     return event_dict
 
 
+# The processor chains are built once, and init_logging() chooses between them.
+_TIMESTAMPER = _CachingTimeStamper()
+_COMMON_PROCESSORS = (
+    structlog.stdlib.add_log_level,
+    _TIMESTAMPER,
+    _render_stack_and_exc_info,
+)
+_CONSOLE_PROCESSORS = _COMMON_PROCESSORS + (structlog.dev.ConsoleRenderer(),)
+_JSON_PROCESSORS = _COMMON_PROCESSORS + (
+    structlog.processors.JSONRenderer(serializer=lenient_json_dump),
+)
+
+
+# Exact-type lookups for the common cases, before the slower isinstance() checks.
+# (Handlers are the unbound methods, to avoid an attribute lookup per object.)
+_JSON_FALLBACK_HANDLERS = {
+    datetime.datetime: datetime.datetime.isoformat,
+    datetime.date: datetime.date.isoformat,
+    uuid.UUID: str,
+    pathlib.PosixPath: str,
+    pathlib.WindowsPath: str,
+    set: list,
+}
+
+
 def lenient_json_fallback(obj):
     """Fallback that should always succeed.
 
@@ -68,14 +392,24 @@ def lenient_json_fallback(obj):
     (intended for use in places such as json-based logs where you always want the
     message recorded)
     """
-    if isinstance(obj, (datetime.datetime, datetime.date)):
-        return obj.isoformat()
+    handler = _JSON_FALLBACK_HANDLERS.get(type(obj))
+    if handler is not None:
+        return handler(obj)
 
-    if isinstance(obj, (pathlib.Path, uuid.UUID)):
-        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        handler = type(obj).isoformat
+    elif isinstance(obj, (pathlib.Path, uuid.UUID)):
+        handler = str
+    elif isinstance(obj, set):
+        handler = list
+    else:
+        handler = None
 
-    if isinstance(obj, set):
-        return list(obj)
+    if handler is not None:
+        # Remember subclasses too, so later objects of the same type are a
+        # single lookup.
+        _JSON_FALLBACK_HANDLERS[type(obj)] = handler
+        return handler(obj)
 
     try:
         # Allow class to define their own.
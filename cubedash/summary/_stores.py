@@ -14,7 +14,7 @@ from geoalchemy2 import WKBElement
 from geoalchemy2 import shape as geo_shape
 from geoalchemy2.shape import to_shape
 from shapely.geometry.base import BaseGeometry
-from sqlalchemy import DDL, String, and_, func, select
+from sqlalchemy import DDL, String, and_, func, select, tuple_
 from sqlalchemy.dialects import postgresql as postgres
 from sqlalchemy.dialects.postgresql import TSTZRANGE
 from sqlalchemy.engine import Engine
@@ -448,6 +448,7 @@ class SummaryStore:
         bbox: Tuple[float, float, float, float] = None,
         limit: int = 500,
         offset: int = 0,
+        after: Optional[Tuple[datetime, UUID]] = None,
         full_dataset: bool = False,
         dataset_ids: Sequence[UUID] = None,
         require_geometry=True,
@@ -460,6 +461,9 @@ class SummaryStore:
         (if full_dataset==True)
 
         Returned results are always sorted by (center_time, id)
+
+        For paging, prefer `after` (the (center_time, id) of the last item seen)
+        to `offset`: postgres has to read through every offset row to skip it.
         """
         geom = func.ST_Transform(DATASET_SPATIAL.c.footprint, 4326)
 
@@ -498,11 +502,10 @@ class SummaryStore:
             )
 
         if bbox:
-            query = query.where(
-                func.ST_Transform(DATASET_SPATIAL.c.footprint, 4326).intersects(
-                    func.ST_MakeEnvelope(*bbox)
-                )
-            )
+            # The same expression as our gist index, and an envelope in the same
+            # srid, so that postgis can filter with the index (ST_Intersects does an
+            # implicit '&&' bounding box check) rather than testing every row.
+            query = query.where(geom.intersects(func.ST_MakeEnvelope(*bbox, 4326)))
 
         if product_name:
             query = query.where(
@@ -518,13 +521,15 @@ class SummaryStore:
         if require_geometry:
             query = query.where(DATASET_SPATIAL.c.footprint != None)
 
+        if after:
+            query = query.where(
+                tuple_(DATASET_SPATIAL.c.center_time, DATASET_SPATIAL.c.id) > after
+            )
+
         if ordered:
             query = query.order_by(DATASET_SPATIAL.c.center_time, DATASET_SPATIAL.c.id)
 
-        query = query.limit(limit).offset(
-            # TODO: Offset/limit isn't particularly efficient for paging...
-            offset
-        )
+        query = query.limit(limit).offset(offset)
 
         for r in self._engine.execute(query):
             yield DatasetItem(
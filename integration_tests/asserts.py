@@ -7,6 +7,7 @@ from textwrap import indent
 from typing import Dict, Optional, Set, Tuple
 
 import jsonschema
+import orjson
 from dateutil.tz import tzutc
 from flask import Response
 from flask.testing import FlaskClient
@@ -15,25 +16,37 @@ from requests_html import HTML
 from cubedash._utils import default_utc
 from cubedash.summary import TimePeriodOverview
 from datacube.model import Range
-from datacube.utils import InvalidDocException, validate_document
+from datacube.utils import InvalidDocException
 
 # GeoJSON schema from http://geojson.org/schema/FeatureCollection.json
 _FEATURE_COLLECTION_SCHEMA_PATH = (
     Path(__file__).parent / "schemas" / "FeatureCollection.json"
 )
 _FEATURE_COLLECTION_SCHEMA = json.load(_FEATURE_COLLECTION_SCHEMA_PATH.open("r"))
+# Built once: validate_document() would re-check the schema and build a new
+# validator on every call.
+jsonschema.Draft7Validator.check_schema(_FEATURE_COLLECTION_SCHEMA)
+_FEATURE_COLLECTION_VALIDATOR = jsonschema.Draft7Validator(_FEATURE_COLLECTION_SCHEMA)
 
 
 def get_geojson(client: FlaskClient, url: str) -> Dict:
     data = get_json(client, url)
-    validate_document(
-        data,
-        _FEATURE_COLLECTION_SCHEMA,
-        schema_folder=_FEATURE_COLLECTION_SCHEMA_PATH.parent,
-    )
+    validate_with(data, _FEATURE_COLLECTION_VALIDATOR)
     return data
 
 
+def validate_with(document: Dict, validator: jsonschema.Draft7Validator):
+    """
+    Validate a document against a prepared schema validator.
+
+    (Raising the same error as datacube's validate_document())
+    """
+    try:
+        validator.validate(document)
+    except jsonschema.ValidationError as e:
+        raise InvalidDocException(e)
+
+
 def get_html_response(client: FlaskClient, url: str) -> Tuple[HTML, Response]:
     response: Response = client.get(url)
     assert response.status_code == 200, response.data.decode("utf-8")
@@ -46,7 +59,7 @@ def get_json(client: FlaskClient, url: str) -> Dict:
     try:
         assert rv.status_code == 200, rv.data
         assert rv.is_json, "Expected json content type in response"
-        data = rv.json
+        data = orjson.loads(rv.data)
         assert data is not None, "Empty response from server"
     except AssertionError:
         pprint(rv.data)
@@ -59,23 +72,41 @@ def get_html(client: FlaskClient, url: str) -> HTML:
     return html
 
 
+def find_first(html: HTML, selector: str):
+    """
+    Get the first element matching a css selector.
+
+    This queries the already-parsed lxml tree directly, as HTML.find() wraps every
+    match in PyQuery objects, which adds up in frequently-called assertions.
+    """
+    __tracebackhide__ = True
+    found = html.lxml.cssselect(selector)
+    assert found, f"Nothing found matching {selector!r}"
+    return found[0]
+
+
+def text_of(element) -> str:
+    """
+    The text of an lxml element, with whitespace collapsed (like HTML.find().text)
+    """
+    return " ".join(element.text_content().split())
+
+
 def check_area(area_pattern, html):
     assert re.match(
         area_pattern + r" \(approx",
-        html.find(".coverage-footprint-area", first=True).text,
+        text_of(find_first(html, ".coverage-footprint-area")),
     )
 
 
 def check_last_processed(html, time):
     __tracebackhide__ = True
-    assert (
-        html.find(".last-processed time", first=True).attrs["datetime"].startswith(time)
-    )
+    assert find_first(html, ".last-processed time").get("datetime").startswith(time)
 
 
 def check_dataset_count(html, count: int):
     __tracebackhide__ = True
-    actual = html.find(".dataset-count", first=True).text
+    actual = text_of(find_first(html, ".dataset-count"))
     expected = "{:,d}".format(count)
     assert (
         f"{expected} dataset" in actual
@@ -189,10 +220,10 @@ class DebugContext:
         if exc_type is None:
             return
         if issubclass(exc_type, (AssertionError, InvalidDocException)):
-            _add_context(exc_val, self.msg)
+            add_context(exc_val, self.msg)
 
 
-def _add_context(e: AssertionError, context_message: str):
+def add_context(e: AssertionError, context_message: str):
     """
     Append some extra information to an assertion error message .
 
@@ -26,15 +26,33 @@ module_dea_index = factories.dea_index_fixture("module_index", scope="module")
 TEST_DATA_DIR = Path(__file__).parent / "data"
 
 
-@pytest.fixture(scope="function")
-def summary_store(module_dea_index: Index) -> SummaryStore:
-    store = SummaryStore.create(module_dea_index)
+def _create_summary_store(index: Index) -> SummaryStore:
+    """A new, empty summary store over the given index"""
+    store = SummaryStore.create(index)
     store.drop_all()
-    module_dea_index.close()
+    index.close()
     store.init()
     return store
 
 
+def _create_client(store: SummaryStore) -> FlaskClient:
+    """A test client for the app, serving from the given store"""
+    _model.cache.clear()
+    _model.STORE = store
+    cubedash.app.config["TESTING"] = True
+    return cubedash.app.test_client()
+
+
+def _summarise_all_products(store: SummaryStore):
+    for product in store.index.products.get_all():
+        store.get_or_update(product.name)
+
+
+@pytest.fixture(scope="function")
+def summary_store(module_dea_index: Index) -> SummaryStore:
+    return _create_summary_store(module_dea_index)
+
+
 @pytest.fixture(scope="function")
 def summariser(summary_store: SummaryStore):
     return summary_store._summariser
@@ -45,6 +63,13 @@ def init_logs(pytestconfig):
     logs.init_logging(verbose=pytestconfig.getoption("verbose") > 0)
 
 
+@pytest.hookimpl(hookwrapper=True, trylast=True)
+def pytest_runtest_call(item):
+    yield
+    # Write out any batched log events while this test's output is still captured.
+    logs.flush_logs()
+
+
 @pytest.fixture
 def tmppath(tmpdir):
     return Path(str(tmpdir))
@@ -84,7 +109,9 @@ def dataset_loader(module_dea_index):
         ls8_nbar_scene = module_dea_index.products.get_by_name(expected_type)
         dataset_count = 0
 
-        create_dataset = Doc2Dataset(module_dea_index)
+        # Our dumps are self-consistent, so skip comparing each embedded source
+        # document against the index: it's several extra queries per dataset.
+        create_dataset = Doc2Dataset(module_dea_index, verify_lineage=False)
 
         for _, doc in read_documents(dump_path):
             label = doc["ga_label"] if ("ga_label" in doc) else doc["id"]
@@ -107,10 +134,7 @@ def dataset_loader(module_dea_index):
 
 @pytest.fixture(scope="function")
 def empty_client(summary_store: SummaryStore) -> FlaskClient:
-    _model.cache.clear()
-    _model.STORE = summary_store
-    cubedash.app.config["TESTING"] = True
-    return cubedash.app.test_client()
+    return _create_client(summary_store)
 
 
 @pytest.fixture(scope="function")
@@ -123,8 +147,7 @@ def unpopulated_client(
 
 @pytest.fixture(scope="function")
 def client(unpopulated_client: FlaskClient) -> FlaskClient:
-    for product in _model.STORE.index.products.get_all():
-        _model.STORE.get_or_update(product.name)
+    _summarise_all_products(_model.STORE)
     return unpopulated_client
 
 
@@ -152,3 +175,19 @@ def populated_index(dataset_loader, module_dea_index):
     assert loaded == 20
 
     return module_dea_index
+
+
+@pytest.fixture(scope="module")
+def populated_client(populated_index: Index) -> FlaskClient:
+    """
+    A client over the populated index, with summaries generated once per module.
+
+    Much cheaper than the function-scoped `client`, but only usable by modules
+    that don't modify the summaries or use the function-scoped stores (which reset
+    them).
+    """
+    store = _create_summary_store(populated_index)
+    client = _create_client(store)
+    store.refresh_all_products()
+    _summarise_all_products(store)
+    return client
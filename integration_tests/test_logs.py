@@ -0,0 +1,231 @@
+"""
+Tests for our structured log output
+"""
+import datetime
+import io
+import json
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+import structlog
+
+from cubedash import logs
+
+
+@pytest.fixture
+def init_test_logging():
+    """
+    Let a test initialise logging itself, restoring our normal test logging afterwards.
+    """
+    previous_config = structlog.get_config()
+    previous_event_log = logs._EVENT_LOG
+    yield logs.init_logging
+    logs.flush_logs()
+    logs._EVENT_LOG = previous_event_log
+    structlog.configure(**previous_config)
+
+
+def test_batched_events_wait_for_a_flush():
+    out = io.BytesIO()
+    log = logs._BatchedBytesLogger(out, max_delay=60)
+
+    log.debug(b"one")
+    log.info(b"two")
+    assert out.getvalue() == b""
+
+    log.flush()
+    assert out.getvalue() == b"one\ntwo\n"
+
+
+def test_warnings_are_written_immediately():
+    out = io.BytesIO()
+    log = logs._BatchedBytesLogger(out, max_delay=60)
+
+    log.info(b"before")
+    log.warning(b"warning")
+    # ... along with anything batched before them, in order.
+    assert out.getvalue() == b"before\nwarning\n"
+
+    log.error(b"error")
+    assert out.getvalue() == b"before\nwarning\nerror\n"
+
+
+def test_full_batches_are_written():
+    out = io.BytesIO()
+    log = logs._BatchedBytesLogger(out, buffer_size=10, max_delay=60)
+
+    log.info(b"12345")
+    assert out.getvalue() == b""
+    log.info(b"6789")
+    assert out.getvalue() == b"12345\n6789\n"
+
+
+def test_batches_are_written_after_a_delay():
+    out = io.BytesIO()
+    log = logs._BatchedBytesLogger(out, max_delay=0.01)
+
+    log.info(b"eventually")
+    deadline = time.time() + 5
+    while not out.getvalue() and time.time() < deadline:
+        time.sleep(0.01)
+    assert out.getvalue() == b"eventually\n"
+
+
+def test_no_events_are_lost_across_threads():
+    out = io.BytesIO()
+    log = logs._BatchedBytesLogger(out, buffer_size=100, max_delay=60)
+
+    def log_lines():
+        for _ in range(1000):
+            log.info(b"line")
+
+    threads = [threading.Thread(target=log_lines) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.flush()
+
+    assert out.getvalue().count(b"line\n") == 4000
+
+
+_SERIALISERS = [
+    pytest.param(
+        logs._orjson_dumps,
+        id="orjson",
+        marks=pytest.mark.skipif(logs.orjson is None, reason="No orjson"),
+    ),
+    pytest.param(logs._rapidjson_dumps, id="rapidjson"),
+]
+
+
+@pytest.mark.parametrize("dumps", _SERIALISERS)
+def test_json_rendering(dumps):
+    class Unknown:
+        def __repr__(self):
+            return "<unknown>"
+
+    rendered = dumps(
+        dict(
+            event="ünicode",
+            time=datetime.datetime(2020, 1, 2, 3, 4, 5),
+            utc_time=datetime.datetime(
+                2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc
+            ),
+            day=datetime.date(2020, 1, 2),
+            id=uuid.UUID("87676cf2-ef18-47b5-ba30-53a99539428d"),
+            path=Path("/tmp/a"),
+            other=Unknown(),
+        )
+    )
+    assert isinstance(rendered, bytes)
+    assert rendered.decode("utf-8") == (
+        '{"event":"ünicode",'
+        '"time":"2020-01-02T03:04:05",'
+        '"utc_time":"2020-01-02T03:04:05+00:00",'
+        '"day":"2020-01-02",'
+        '"id":"87676cf2-ef18-47b5-ba30-53a99539428d",'
+        '"path":"/tmp/a",'
+        '"other":"<unknown>"}'
+    )
+
+
+@pytest.mark.parametrize("dumps", _SERIALISERS)
+def test_json_rendering_never_fails(dumps):
+    # Values that json libraries may refuse without calling our fallback.
+    assert json.loads(dumps(dict(big=1 << 70))) == dict(big=1 << 70)
+    assert json.loads(dumps(dict(keys={1: 2}))) in (
+        dict(keys={"1": 2}),
+        # (rapidjson can't render non-string keys, so repr()s the dict)
+        dict(keys="{1: 2}"),
+    )
+
+
+def _read_events(output: io.BytesIO) -> List[Dict]:
+    logs.flush_logs()
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_informational_events_only_logged_when_verbose(init_test_logging):
+    output = io.BytesIO()
+    init_test_logging(output)
+    log = structlog.get_logger()
+    log.debug("debug")
+    log.info("info")
+    log.warning("warning")
+    assert [e["event"] for e in _read_events(output)] == ["warning"]
+
+    output = io.BytesIO()
+    init_test_logging(output, verbose=True)
+    log = structlog.get_logger()
+    log.debug("debug")
+    log.info("info")
+    assert [e["event"] for e in _read_events(output)] == ["debug", "info"]
+
+
+def test_event_rendering(init_test_logging):
+    output = io.BytesIO()
+    init_test_logging(output)
+    log = structlog.get_logger()
+
+    log.warning("with stack", stack_info=True)
+    try:
+        raise ValueError("Expected failure")
+    except ValueError:
+        log.exception("with exception")
+
+    stack_event, exception_event = _read_events(output)
+
+    for event in (stack_event, exception_event):
+        assert re.fullmatch(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ", event["timestamp"])
+    assert stack_event["level"] == "warning"
+    assert exception_event["level"] == "error"
+
+    # The stack should end at our logging call, not inside the logging machinery.
+    *_, last_frame = stack_event["stack"].rstrip().split("\n  File ")
+    assert "test_logs.py" in last_frame
+    assert "in test_event_rendering" in last_frame
+
+    assert "ValueError: Expected failure" in exception_event["exception"]
+    assert "exc_info" not in exception_event
+
+
+def test_logging_to_a_text_stream(init_test_logging):
+    output = io.StringIO()
+    init_test_logging(output)
+
+    structlog.get_logger().warning("to text")
+    logs.flush_logs()
+    assert json.loads(output.getvalue())["event"] == "to text"
+
+
+# Terminates itself while it's in the middle of writing a log event.
+_SIGTERM_DURING_WRITE = """
+import io, os, signal, structlog
+from cubedash import logs
+
+class SignallingFile(io.BytesIO):
+    def isatty(self):
+        return False
+
+    def write(self, data):
+        os.kill(os.getpid(), signal.SIGTERM)
+        return super().write(data)
+
+logs.init_logging(SignallingFile())
+structlog.get_logger().warning("interrupted")
+"""
+
+
+def test_sigterm_during_a_log_write_exits():
+    # It used to hang forever, waiting for the lock held by the interrupted write.
+    process = subprocess.run([sys.executable, "-c", _SIGTERM_DURING_WRITE], timeout=30)
+    assert process.returncode == 128 + signal.SIGTERM
@@ -1,8 +1,6 @@
 """
 Tests that load pages and check the contained text.
 """
-import json
-
 import pytest
 from click.testing import Result
 from dateutil import tz
@@ -17,8 +15,10 @@ from integration_tests.asserts import (
     check_area,
     check_dataset_count,
     check_last_processed,
+    find_first,
     get_geojson,
     get_html,
+    text_of,
 )
 
 DEFAULT_TZ = tz.gettz("Australia/Darwin")
@@ -173,7 +173,7 @@ def _h1_text(html):
 
 
 def _text(html, tag):
-    return html.find(tag, first=True).text
+    return text_of(find_first(html, tag))
 
 
 def test_view_product(client: FlaskClient):
@@ -357,7 +357,6 @@ def test_api_returns_limited_tile_regions(client: FlaskClient):
     geojson = get_geojson(client, "/api/regions/wofs_albers/2017/04")
     assert len(geojson["features"]) == 4, "Unexpected wofs albers region month count"
     geojson = get_geojson(client, "/api/regions/wofs_albers/2017/04/20")
-    print(json.dumps(geojson, indent=4))
     assert len(geojson["features"]) == 1, "Unexpected wofs albers region day count"
     geojson = get_geojson(client, "/api/regions/wofs_albers/2017/04/6")
     assert len(geojson["features"]) == 0, "Unexpected wofs albers region count"
@@ -2,13 +2,18 @@
 Tests that hit the stac api
 """
 
-import json
+import functools
+import itertools
+import os
 from pathlib import Path
 from pprint import pformat, pprint
-from typing import Dict, Generator, Iterable, Optional
+from typing import Dict, Generator, Iterable, List, Optional
 
+import fastjsonschema
+import numpy as np
+import orjson
 import pytest
-from boltons.iterutils import research
+import shapely
 from dateutil import tz
 from flask import Response
 from flask.testing import FlaskClient
@@ -17,8 +22,8 @@ from shapely.validation import explain_validity
 
 import cubedash._stac
 from cubedash import _model
-from datacube.utils import validate_document
-from integration_tests.asserts import DebugContext, get_geojson, get_json
+from datacube.utils import InvalidDocException
+from integration_tests.asserts import DebugContext, add_context, get_geojson, get_json
 
 DEFAULT_TZ = tz.gettz("Australia/Darwin")
 
@@ -26,13 +31,31 @@ DEFAULT_TZ = tz.gettz("Australia/Darwin")
 OUR_DATASET_LIMIT = 20
 OUR_PAGE_SIZE = 4
 
+# Search parameters shared by several tests.
+_BBOX_AU = "bbox=[114, -33, 153, -10]"
+_TIME_APR_MAY_2017 = "time=2017-04-16T01:12:16/2017-05-10T00:24:21"
+_SEARCH_AU_APR_MAY_2017 = f"/stac/search?{_BBOX_AU}&{_TIME_APR_MAY_2017}"
+
 _SCHEMA_DIR = Path(__file__).parent / "schemas" / "stac"
 
+
+@functools.lru_cache()
+def _load_schema(path: Path) -> Dict:
+    return orjson.loads(path.read_bytes())
+
+
 # Run `./update.sh` in the schema dir to check for newer versions of these.
 _ITEM_SCHEMA_PATH = _SCHEMA_DIR / "item.json"
-_ITEM_SCHEMA = json.load(_ITEM_SCHEMA_PATH.open("r"))
+_ITEM_SCHEMA = _load_schema(_ITEM_SCHEMA_PATH)
+# Compiled once into python code: much faster than interpreting the schema
+# for each of the hundreds of items we validate.
+_ITEM_SCHEMA_VALIDATOR = fastjsonschema.compile(
+    _ITEM_SCHEMA,
+    # Relative references are to sibling schemas
+    handlers={"": lambda uri: _load_schema(_SCHEMA_DIR / uri)},
+)
 _CATALOG_SCHEMA_PATH = _SCHEMA_DIR / "catalog.json"
-_CATALOG_SCHEMA = json.load(_CATALOG_SCHEMA_PATH.open("r"))
+_CATALOG_SCHEMA = _load_schema(_CATALOG_SCHEMA_PATH)
 
 
 def get_items(client: FlaskClient, url: str) -> Dict:
@@ -49,32 +72,27 @@ def get_item(client: FlaskClient, url: str) -> Dict:
     return data
 
 
-@pytest.fixture(scope="function")
-def stac_client(populated_index, client: FlaskClient):
+@pytest.fixture(scope="module")
+def stac_client(populated_client: FlaskClient):
     """
     Get a client with populated data and standard settings
     """
+    original_settings = cubedash._stac.PAGE_SIZE_LIMIT, cubedash._stac.DEFAULT_PAGE_SIZE
     cubedash._stac.PAGE_SIZE_LIMIT = OUR_DATASET_LIMIT
     cubedash._stac.DEFAULT_PAGE_SIZE = OUR_PAGE_SIZE
-    return client
+    yield populated_client
+    cubedash._stac.PAGE_SIZE_LIMIT, cubedash._stac.DEFAULT_PAGE_SIZE = original_settings
 
 
 def test_stac_loading_all_pages(stac_client: FlaskClient):
     # An unconstrained search returning every dataset.
     # It should return every dataset in order with no duplicates.
-    all_items = _iter_items_across_pages(stac_client, f"/stac/search")
+    all_items = _iter_items_across_pages(stac_client, "/stac/search")
     validate_items(all_items, expect_count=393)
 
     # A constrained search within a bounding box.
     # It should return matching datasets in order with no duplicates.
-    all_items = _iter_items_across_pages(
-        stac_client,
-        (
-            f"/stac/search?"
-            f"&bbox=[114, -33, 153, -10]"
-            f"&time=2017-04-16T01:12:16/2017-05-10T00:24:21"
-        ),
-    )
+    all_items = _iter_items_across_pages(stac_client, _SEARCH_AU_APR_MAY_2017)
     validate_items(all_items, expect_count=66)
 
 
@@ -88,35 +106,81 @@ def validate_items(
     - are all valid individually.
     - (optionally) has a specific count
     """
-    seen_ids = set()
-    last_item = None
-    i = 0
-    for item in items:
-        id_ = item["id"]
-        with DebugContext(f"Invalid item {i}, id {repr(str(id_))}"):
-            validate_item(item)
-
-        # Assert there's no duplicates
-        assert (
-            id_ not in seen_ids
-        ), f"Duplicate dataset item (record {i}) of search results: {id_}"
-        seen_ids.add(id_)
-
-        # Assert they are all ordered (including across pages!)
-        if last_item and expect_ordered:
-            # TODO: this is actually a (date, id) sort, but our test data has no duplicate dates.
-            prev_dt = last_item["properties"]["datetime"]
-            this_dt = item["properties"]["datetime"]
+    # Stop early if paging is stuck in a loop, rather than loading pages forever.
+    if expect_count is not None:
+        items = itertools.islice(items, expect_count + 1)
+    items = list(items)
+
+    for i, item in enumerate(items):
+        try:
+            # Geometries are checked together below.
+            validate_item(item, check_geometry=False)
+        except (AssertionError, InvalidDocException) as e:
+            # (Rather than a DebugContext per item: only format this if failing)
+            add_context(e, f"Invalid item {i}, id {repr(str(item['id']))}")
+            raise
+
+    # The remaining checks are done in bulk, and only look for the specific
+    # offending item if they fail.
+    _assert_unique_ids(items)
+
+    # Assert they are all ordered (including across pages!)
+    if expect_ordered:
+        _assert_ordered(items)
+
+    if not _all_geometries_valid(items):
+        # Find the offending item, for a useful message.
+        for i, item in enumerate(items):
+            with DebugContext(f"Invalid item {i}, id {repr(str(item['id']))}"):
+                _validate_item_geometry(item)
+
+    if expect_count is not None:
+        assert len(items) == expect_count, f"Expected {expect_count} items"
+
+
+def _assert_unique_ids(items: List[Dict]):
+    ids = [item["id"] for item in items]
+    if len(set(ids)) != len(ids):
+        seen_ids = set()
+        for i, id_ in enumerate(ids):
+            assert (
+                id_ not in seen_ids
+            ), f"Duplicate dataset item (record {i}) of search results: {id_}"
+            seen_ids.add(id_)
+
+
+def _assert_ordered(items: List[Dict]):
+    # TODO: this is actually a (date, id) sort, but our test data has no duplicate dates.
+    datetimes = [item["properties"]["datetime"] for item in items]
+    if sorted(set(datetimes)) != datetimes:
+        for i in range(1, len(datetimes)):
+            prev_dt, this_dt = datetimes[i - 1], datetimes[i]
             assert (
                 prev_dt < this_dt
             ), f"Items {i} and {i - 1} out of order: {prev_dt} > {this_dt}"
-        i += 1
 
-    # Note that the above block stops most paging infinite loops quickly
-    # ("already seen this dataset id")
-    # So we perform this length check in the same method and afterwards.
-    if expect_count is not None:
-        assert i == expect_count, f"Expected {expect_count} items"
+
+def _all_geometries_valid(items: List[Dict]) -> bool:
+    """
+    Are all item geometries valid polygons?
+
+    Checked in one vectorised pass with Shapely 2, rather than per item.
+    """
+    if not hasattr(shapely, "from_geojson"):
+        # Shapely 1.x: we'll have to check them one-by-one.
+        return False
+
+    try:
+        geometries = shapely.from_geojson([orjson.dumps(i["geometry"]) for i in items])
+    except shapely.errors.GEOSException:
+        return False
+    return bool(
+        shapely.is_valid(geometries).all()
+        and np.isin(
+            shapely.get_type_id(geometries),
+            (shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON),
+        ).all()
+    )
 
 
 def _iter_items_across_pages(
@@ -134,55 +198,56 @@ def _iter_items_across_pages(
 def test_stac_search_limits(stac_client: FlaskClient):
     # Tell user with error if they request too much.
     large_limit = OUR_DATASET_LIMIT + 1
-    rv: Response = stac_client.get((f"/stac/search?" f"&limit={large_limit}"))
+    rv: Response = stac_client.get(f"/stac/search?limit={large_limit}")
     assert rv.status_code == 400
     assert b"Max page size" in rv.data
 
     # Without limit, it should use the default page size
-    geojson = get_items(
-        stac_client,
-        (
-            "/stac/search?"
-            "&bbox=[114, -33, 153, -10]"
-            "&time=2017-04-16T01:12:16/2017-05-10T00:24:21"
-        ),
-    )
+    geojson = get_items(stac_client, _SEARCH_AU_APR_MAY_2017)
     assert len(geojson.get("features")) == OUR_PAGE_SIZE
 
+    # Further pages continue from a cursor, not an offset.
+    next_href = _get_next_href(geojson)
+    assert "cursor=" in next_href
+    assert "_o=" not in next_href
+
+    # ... which must be valid.
+    rv: Response = stac_client.get("/stac/search?cursor=not-a-cursor")
+    assert rv.status_code == 400
+    assert b"Invalid paging cursor" in rv.data
+    rv: Response = stac_client.post(
+        "/stac/search",
+        data=orjson.dumps({"cursor": 123}),
+        headers={"Content-Type": "application/json", "Accept": "application/json"},
+    )
+    assert rv.status_code == 400
+    assert b"Invalid paging cursor" in rv.data
+
+    # ... and not mixed with offsets.
+    rv: Response = stac_client.get(f"{next_href}&_o=4")
+    assert rv.status_code == 400
+    assert b"cannot be combined with an offset" in rv.data
+
 
 def test_stac_search_bounds(stac_client: FlaskClient):
     # Outside the box there should be no results
     geojson = get_items(
         stac_client,
-        (
-            "/stac/search?"
-            "&bbox=[20,-5,25,10]"
-            "&time=2017-04-16T01:12:16/2017-05-10T00:24:21"
-        ),
+        f"/stac/search?bbox=[20,-5,25,10]&{_TIME_APR_MAY_2017}",
     )
     assert len(geojson.get("features")) == 0
 
     # Search a whole-day for a scene
     geojson = get_items(
         stac_client,
-        (
-            "/stac/search?"
-            "product=ls7_nbar_scene"
-            "&bbox=[114, -33, 153, -10]"
-            "&time=2017-04-20"
-        ),
+        f"/stac/search?product=ls7_nbar_scene&{_BBOX_AU}&time=2017-04-20",
     )
     assert len(geojson.get("features")) == 1
 
     # Search a whole-day on an empty day.
     geojson = get_items(
         stac_client,
-        (
-            "/stac/search?"
-            "product=ls7_nbar_scene"
-            "&bbox=[114, -33, 153, -10]"
-            "&time=2017-04-22"
-        ),
+        f"/stac/search?product=ls7_nbar_scene&{_BBOX_AU}&time=2017-04-22",
     )
     assert len(geojson.get("features")) == 0
 
@@ -191,7 +256,7 @@ def test_stac_search_by_post(stac_client: FlaskClient):
     # Test POST, product, and assets
     rv: Response = stac_client.post(
         "/stac/search",
-        data=json.dumps(
+        data=orjson.dumps(
             {
                 "product": "wofs_albers",
                 "bbox": [114, -33, 153, -10],
@@ -202,7 +267,7 @@ def test_stac_search_by_post(stac_client: FlaskClient):
         headers={"Content-Type": "application/json", "Accept": "application/json"},
     )
     assert rv.status_code == 200
-    doc = rv.json
+    doc = orjson.loads(rv.data)
     assert len(doc.get("features")) == OUR_PAGE_SIZE
     assert "water" in doc["features"][0]["assets"]
     assert doc["features"][0]["assets"]["water"].get("href")
@@ -210,7 +275,7 @@ def test_stac_search_by_post(stac_client: FlaskClient):
     # Test high_tide_comp_20p with POST and assets
     rv: Response = stac_client.post(
         "/stac/search",
-        data=json.dumps(
+        data=orjson.dumps(
             {
                 "product": "high_tide_comp_20p",
                 "bbox": [114, -40, 147, -32],
@@ -221,7 +286,7 @@ def test_stac_search_by_post(stac_client: FlaskClient):
         headers={"Content-Type": "application/json", "Accept": "application/json"},
     )
     assert rv.status_code == 200
-    doc = rv.json
+    doc = orjson.loads(rv.data)
 
     # Features should in include all bands.
     bands = ("blue", "green", "nir", "red", "swir1", "swir2")
@@ -319,7 +384,8 @@ def test_stac_item(stac_client: FlaskClient):
         "http://localhost/collections/wofs_albers/items/87676cf2-ef18-47b5-ba30-53a99539428d",
     )
     # Our item document can still be improved. This is ensuring changes are deliberate.
-    pprint(response)
+    if os.environ.get("STAC_DEBUG"):
+        pprint(response)
     # TODO: These two properties need to be compared with fuzzier float precision
     #       (a minor difference between python installs)
     del response["bbox"]
@@ -371,29 +437,47 @@ def test_stac_item(stac_client: FlaskClient):
 
 def assert_collection(collection: Dict):
     assert "features" in collection, "No features in collection"
-    validate_items(collection["features"])
+    # Note that the items themselves aren't validated here: tests that page through
+    # results run them all through validate_items(), and validating each page here
+    # too would double the (dominant) cost.
 
 
-def validate_item(item: Dict):
-    validate_document(item, _ITEM_SCHEMA, schema_folder=_ITEM_SCHEMA_PATH.parent)
+def validate_item(item: Dict, check_geometry=True):
+    try:
+        _ITEM_SCHEMA_VALIDATOR(item)
+    except fastjsonschema.JsonSchemaException as e:
+        raise InvalidDocException(str(e))
 
-    # Should be a valid polygon
     assert "geometry" in item, "Item has no geometry"
     assert item["geometry"], "Item has blank geometry"
-    with DebugContext(f"Failing shape:\n{pformat(item['geometry'])}"):
+    if check_geometry:
+        _validate_item_geometry(item)
+
+    # href should never be blank if present
+    # -> The jsonschema enforces href as required, but it's not checking for emptiness.
+    #    (and we've had empty ones in previous prototypes)
+    #    (Items have a known shape, so we check those fields directly rather than
+    #     walking the entire document.)
+    for i, link in enumerate(item.get("links", ())):
+        assert link["href"].strip(), f"href has empty value: 'links'→{i}"
+    for name, asset in item.get("assets", {}).items():
+        assert asset["href"].strip(), f"href has empty value: 'assets'→{name!r}"
+        for secondary_href in asset.get("odc:secondary_hrefs", ()):
+            assert secondary_href.strip(), f"Asset {name!r} has an empty secondary href"
+
+
+def _validate_item_geometry(item: Dict):
+    # Should be a valid polygon
+    try:
         shape = shapely_shape(item["geometry"])
         assert shape.is_valid, f"Item has invalid geometry: {explain_validity(shape)}"
         assert shape.geom_type in (
             "Polygon",
             "MultiPolygon",
         ), "Unexpected type of shape"
-
-    # href should never be blank if present
-    # -> The jsonschema enforces href as required, but it's not checking for emptiness.
-    #    (and we've had empty ones in previous prototypes)
-    for offset, value in research(item, lambda p, k, v: k == "href"):
-        viewable_offset = "→".join(map(repr, offset))
-        assert value.strip(), f"href has empty value: {repr(viewable_offset)}"
+    except AssertionError as e:
+        add_context(e, f"Failing shape:\n{pformat(item['geometry'])}")
+        raise
 
 
 def _get_next_href(geojson: Dict) -> Optional[str]:
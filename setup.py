@@ -5,11 +5,12 @@ from setuptools import find_packages, setup
 tests_require = [
     "black",
     "docutils",
-    "boltons",
     "digitalearthau",
+    "fastjsonschema",
     "flake8",
     "isort[requirements]",
     "jsonschema > 3",
+    "orjson",
     "pytest",
     "pytest-benchmark",
     "pytest-cov",
@@ -22,6 +23,7 @@ extras_require = {
     "deployment": [
         # Performance
         "ciso8601",
+        "orjson",
         "bottleneck",
         # The default run.sh and docs use gunicorn+meinheld
         "gunicorn",
@@ -63,7 +65,7 @@ setup(
         "shapely",
         "simplekml",
         "sqlalchemy",
-        "structlog",
+        "structlog>=20.2",
     ],
     tests_require=tests_require,
     extras_require=extras_require,